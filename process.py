@@ -2,117 +2,265 @@
 
 import configparser
 import logging
-import xlrd
+import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Generator, Tuple
+from typing import Generator, Optional, Tuple
 
 import numpy as np
 import pandas as pd
 
-logging.basicConfig(level=logging.DEBUG, format="%(levelname)s:%(message)s")
 
-XLS_FLOAT_TYPE = 2
+def _configure_logging():
+    logging.basicConfig(level=logging.DEBUG, format="%(levelname)s:%(message)s")
+
+
+_configure_logging()
 
 converters = {"Account Number": int}
 
+# the filter columns hold a handful of repeating strings; category storage shrinks
+# them drastically per bill (and in the Parquet cache), but concat demotes columns
+# whose category sets differ, so process() re-casts the combined frame before
+# filtering to get integer code compares in the equality masks
+dtypes = {"Metered Usage [kWh]": "float64",
+          "Service Classification": "category",
+          "Reason Not Billed": "category"}
+
+CACHE_DIR = Path(".cache")  # parsed bills cached as Parquet, keyed by size/mtime
 
-def find_in_sheet(val, sheet: xlrd.sheet.Sheet) -> Tuple[int, int]:
-    """Return a tuple containing the (row, col) of first match searching row 0, then row 1, etc."""
-    for row in range(sheet.nrows):
-        for col in range(sheet.ncols):
-            if sheet.cell_value(row, col) == val:
-                return row, col
-    raise LookupError(f'Value {val} not found in sheet {sheet}')
+OUTPUT_STEM = "output"  # output workbooks are output.xlsx or output_<N>.xlsx
 
+# 0-based coordinates of the stable Hydro One summary-bill layout; bills matching
+# these skip the probing pass entirely, anything else falls back to _probe_sheet
+HYDRO_HEADER_ROW = 6
+HYDRO_LAST_COL = 21
 
-def get_billing_lines(sheet: xlrd.sheet.Sheet) -> int:
-    """Take an xl sheet with a Hydro One bill as input and return the number of billing lines (accounts)"""
+
+def _probe_sheet(sheet) -> Tuple[int, int, int]:
+    """Stream the invoice sheet and return (label_row, last_col, lines): the index of the
+    row with column headers ("Line #"), the index of the last desired column
+    ("Metered Usage [kWh]"), and the number of billing lines (accounts). Stops streaming
+    as soon as the contiguous run of billing lines ends."""
+    label_row = label_col = last_col = None
     lines = 0
-    try:
-        row, col = find_in_sheet("Line #", sheet)  # this cell should be unique
-    except LookupError:
+    for row_index, row in enumerate(sheet.iter_rows(values_only=True)):
+        if label_row is None:
+            # both labels live on the header row, so only that one row needs a
+            # cell-by-cell scan; every other row is a single membership test
+            if "Line #" in row:  # this cell should be unique
+                label_row = row_index
+                labels = {"Line #": None, "Metered Usage [kWh]": None}
+                for col_index, value in enumerate(row):
+                    if value in labels:
+                        labels[value] = col_index
+                label_col = labels["Line #"]
+                last_col = labels["Metered Usage [kWh]"]
+        elif label_col < len(row) and isinstance(row[label_col], (int, float)):
+            # count billing lines by walking down the contiguous run of numbers;
+            # deliberately not a vectorized type scan over the whole column, which
+            # would force streaming the footer rows this loop exists to skip
+            lines += 1
+        else:
+            break  # end of the billing lines; the rest of the sheet is footer
+
+    if label_row is None:
         raise ValueError(f'{sheet} does not appear to be a Hydro One bill (no "Line #" cell)')
+    if last_col is None:
+        raise LookupError(f'Value "Metered Usage [kWh]" not found in sheet {sheet}')
+    return label_row, last_col, lines
+
+
+def _try_fixed_layout(xl: pd.ExcelFile) -> Optional[pd.DataFrame]:
+    """Fast path: parse assuming the stable Hydro One layout, skipping the probe.
+    Returns None when the sheet does not match the expected shape."""
+    # validate cheaply before committing to a full parse: read just the header
+    # row and check the expected labels are where the fixed layout puts them
+    try:
+        header = pd.read_excel(io=xl,
+                               sheet_name="Invoice Summary",
+                               header=HYDRO_HEADER_ROW,
+                               nrows=0,
+                               usecols=list(range(1, HYDRO_LAST_COL + 1)))
+    except (ValueError, IndexError):  # sheet too short or too narrow
+        return None
+    expected = set(dtypes) | {"Reading From Date", "Reading To Date"}
+    if not expected.issubset(header.columns):
+        return None
+
+    # the full parse runs without the strict reader dtypes: the footer rides
+    # along (there is no probe line count to bound it), and stray footer text
+    # under a float64 column would abort the read; convert after trimming
+    bill = pd.read_excel(io=xl,
+                         sheet_name="Invoice Summary",
+                         header=HYDRO_HEADER_ROW,
+                         index_col=0,
+                         usecols=list(range(1, HYDRO_LAST_COL + 1)))
 
-    # find number of lines in bill by walking down
-    row += 1
-    while sheet.cell_type(row, col) == XLS_FLOAT_TYPE:
-        row += 1
-        lines += 1
-    return lines
+    # the billing lines are the leading run of rows with numeric account numbers
+    numeric = pd.to_numeric(pd.Index(bill.index), errors="coerce").notna()
+    lines = int(np.argmin(numeric)) if not numeric.all() else len(numeric)
+    if lines == 0:
+        return None
+    bill = bill.iloc[:lines].copy()
+    bill.index = bill.index.astype(np.int64)  # same as the Account Number converter
+    for date_col in ("Reading From Date", "Reading To Date"):
+        bill[date_col] = pd.to_datetime(bill[date_col])
+    # the footer NaNs forced integer columns to float64 before the trim; restore
+    # int64 where the values allow it so both parse paths cache identical frames
+    for col in bill.columns:
+        values = bill[col]
+        if values.dtype == np.float64 and col not in dtypes \
+                and values.notna().all() and (values % 1 == 0).all():
+            bill[col] = values.astype(np.int64)
+    return bill.astype(dtypes)
 
 
 def get_bill_dataframe(filename: Path) -> pd.DataFrame:
     """Take the name of an Excel file containing a Hydro One bill and return a Pandas dataframe
     constructed from a select area of the invoice sheet."""
 
+    # reading Parquet back is around two orders of magnitude faster than parsing
+    # Excel, so warm runs skip the spreadsheet entirely; the size/mtime key means
+    # a touched or re-downloaded bill simply misses the cache and is re-parsed
+    stat = filename.stat()
+    cache_path = CACHE_DIR / f"{filename.stem}_{stat.st_size}_{stat.st_mtime_ns}.parquet"
+    if cache_path.is_file():
+        logging.debug(f"Reading {filename} from cache {cache_path}")
+        cached = pd.read_parquet(cache_path)
+        # Parquet round-trips an all-NaN categorical column as float64; re-apply
+        # the reader dtypes so warm and cold runs feed identical frames downstream
+        return cached.astype({col: dtype for col, dtype in dtypes.items() if col in cached.columns})
+
     logging.debug(f"Reading {filename}")
-    with xlrd.open_workbook(filename=filename) as xl:
+    # pandas opens this workbook with read_only=True, data_only=True and
+    # keep_links=False, so neither the probe nor the parse below pays for
+    # styles, formulas, or external links
+    with pd.ExcelFile(filename, engine="openpyxl") as xl:
         try:
-            sheet = xl.sheet_by_name("Invoice Summary")  # this sheet contains the bill
-        except xlrd.biffh.XLRDError:
+            sheet = xl.book["Invoice Summary"]  # this sheet contains the bill
+        except KeyError:
             logging.error(f"Not able to open sheet \"Invoice Summary\" in {filename}")
             raise
 
-        num_rows = sheet.nrows
-        lines = get_billing_lines(sheet)
-        logging.info(f"{filename} has {lines} account lines.")
-        label_row, _ = find_in_sheet("Line #", sheet)  # index of row with column headers
-        logging.debug(f"Label row index: {label_row}")
-        _, last_col = find_in_sheet("Metered Usage [kWh]", sheet)  # index of last desired column
-        logging.debug(f"Last column to parse: {last_col}")
-        footer_size = num_rows - (label_row + 1) - lines
-        logging.debug(f"Footer size: {footer_size}")
-
-        return pd.read_excel(io=filename,
-                             sheet_name="Invoice Summary",
-                             header=label_row,
-                             skipfooter=footer_size,
-                             index_col=0,
-                             converters=converters,
-                             usecols=list(range(1, last_col + 1)))
+        bill = _try_fixed_layout(xl)
+        if bill is None:
+            label_row, last_col, lines = _probe_sheet(sheet)
+            logging.info(f"{filename} has {lines} account lines.")
+            logging.debug(f"Label row index: {label_row}")
+            logging.debug(f"Last column to parse: {last_col}")
+
+            bill = pd.read_excel(io=xl,
+                                 sheet_name="Invoice Summary",
+                                 header=label_row,
+                                 nrows=lines,
+                                 index_col=0,
+                                 converters=converters,
+                                 parse_dates=["Reading From Date", "Reading To Date"],
+                                 dtype=dtypes,
+                                 usecols=list(range(1, last_col + 1)))
+        else:
+            logging.debug(f"{filename} matched the fixed Hydro One layout; probe skipped")
+
+    CACHE_DIR.mkdir(exist_ok=True)
+    bill.to_parquet(cache_path, compression="zstd")
+    return bill
 
 
 def process(spreadsheets: Generator[Path, None, None], config) -> pd.DataFrame:
-    bills = [get_bill_dataframe(filename) for filename in spreadsheets]
+    paths = list(spreadsheets)
+    # parsing is CPU-bound per file and independent across files, so fan out over
+    # cores; note pd.concat materializes the iterable into a list before joining,
+    # so feeding it executor.map directly is convenience, not a memory saving
+    with ProcessPoolExecutor(max_workers=os.cpu_count(), initializer=_configure_logging) as executor:
+        # join all bills in preparation for splitting by account number
+        mass_df = pd.concat(executor.map(get_bill_dataframe, paths))
     logging.debug("Completed loading dataframes from Excel.")
-    mass_df = pd.concat(bills)  # join all bills in preparation for splitting by account number
-    # convert date columns from strings
-    mass_df['Reading From Date'] = pd.to_datetime(mass_df['Reading From Date'])
-    mass_df['Reading From Date'] = [dt.date() for dt in mass_df['Reading From Date']]
-    mass_df['Reading To Date'] = pd.to_datetime(mass_df['Reading To Date'])
-    mass_df['Reading To Date'] = [dt.date() for dt in mass_df['Reading To Date']]
+    # each bill arrives with its own category set, so concat demoted these columns
+    # to plain strings; re-cast once so the filter masks compare integer codes
+    for category_col in ("Service Classification", "Reason Not Billed"):
+        mass_df[category_col] = mass_df[category_col].astype("category")
+    # dates were parsed by the reader; day precision keeps the arithmetic below exact
+    mass_df['Reading From Date'] = mass_df['Reading From Date'].values.astype('datetime64[D]')
+    mass_df['Reading To Date'] = mass_df['Reading To Date'].values.astype('datetime64[D]')
 
     # new columns
-    mass_df['Days In Reading'] = mass_df['Reading To Date'] - mass_df['Reading From Date']
-    mass_df['Days In Reading'] = mass_df['Days In Reading'] / np.timedelta64(1, 'D')
-    mass_df['kWh Per Day'] = mass_df['Metered Usage [kWh]'] / mass_df['Days In Reading']
+    # one int subtraction per row; the day counts ARE the timedelta64[D] payload,
+    # so reinterpret with .view rather than converting (timedelta64 is int64-backed,
+    # so an int32 view would misread the buffer)
+    mass_df['Days In Reading'] = (
+        mass_df['Reading To Date'].values - mass_df['Reading From Date'].values
+    ).astype('timedelta64[D]').view(np.int64)
 
-    # drop certain types of rows: unbilled entries, and sentinel lights
-    mass_df = mass_df[mass_df["Service Classification"] != "Sentinel Lights"]
-    mass_df = mass_df[mass_df["Reason Not Billed"] != "No billing as of summary billing cut off date"]
+    # drop certain types of rows: unbilled entries, and sentinel lights; one
+    # fused mask and one selection, compared at Series level so the comparison
+    # stays correct whatever dtype the columns arrive with
+    keep = (mass_df["Service Classification"] != "Sentinel Lights") \
+        & (mass_df["Reason Not Billed"] != "No billing as of summary billing cut off date")
+    mass_df = mass_df.loc[keep]
 
-    # after processing, drop columns according to config
+    # computed after the mask so the divide only touches surviving rows
+    usage = mass_df['Metered Usage [kWh]'].to_numpy(dtype=np.float64, copy=False)
+    days = mass_df['Days In Reading'].to_numpy(dtype=np.float64, copy=False)
+    mass_df['kWh Per Day'] = np.divide(usage, days)
+
+    # after processing, drop columns according to config, copying the frame only once
     if "Drop" in config:
-        for drop_label in mass_df.columns.values.tolist():
-            if drop_label.lower() in config["Drop"]:
-                mass_df = mass_df.drop(labels=drop_label, axis=1)
-                logging.info(f"Dropped column \"{drop_label}\" according to config")
+        # snapshot the section once: membership tests against the configparser proxy
+        # would go through its case-insensitive lookup for every column
+        drop_set = frozenset(key.lower() for key in config["Drop"])
+        to_drop = [label for label in mass_df.columns if label.lower() in drop_set]
+        mass_df = mass_df.drop(columns=to_drop)
+        for drop_label in to_drop:
+            logging.info(f"Dropped column \"{drop_label}\" according to config")
 
     return mass_df
 
 
+def _write_shard(output_name: str, sheets: list) -> None:
+    """Write one output workbook containing the given (account_num, worksheet_name,
+    account_df) sheets."""
+    # the date columns stay datetime64 in memory, so render them date-only here
+    # instead of boxing them upstream; note xlsxwriter's constant_memory mode is
+    # NOT safe here: pandas emits body cells column by column, and forward-only
+    # row flushing would silently drop every column but the last
+    with pd.ExcelWriter(output_name,
+                        engine="xlsxwriter",
+                        datetime_format="yyyy-mm-dd",
+                        date_format="yyyy-mm-dd") as writer:
+        for account_num, worksheet_name, account_df in sheets:
+            account_df.to_excel(writer, sheet_name=worksheet_name)
+            logging.info(f"Wrote results for account {account_num} to {output_name} in sheet {worksheet_name}")
+
+
 def write_output(mass_df: pd.DataFrame, aliases: dict):
-    accounts = set(mass_df.index)  # unique account numbers
+    mass_df = mass_df.sort_index()  # contiguous accounts, so groupby partitions in one pass
+
+    sheets = []
+    for account_num, account_df in mass_df.groupby(level=0, sort=False):
+        if str(account_num) in aliases:
+            worksheet_name = aliases[str(account_num)]
+        else:
+            worksheet_name = str(account_num)
+        sheets.append((account_num, worksheet_name, account_df))
+
+    # the shard count follows cpu_count, so a previous run may have left more
+    # shards behind than this run will overwrite; clear every prior output first
+    for stale in Path.cwd().glob(f"{OUTPUT_STEM}*.xlsx"):
+        stale.unlink()
+        logging.debug(f"Removed stale output file {stale.name}")
+
+    workers = min(os.cpu_count() or 1, len(sheets))
+    if workers <= 1:
+        _write_shard(f"{OUTPUT_STEM}.xlsx", sheets)
+        return
 
-    # write a spreadsheet with processed results
-    with pd.ExcelWriter("output.xlsx") as writer:
-        for account_num in accounts:
-            if str(account_num) in aliases:
-                worksheet_name = aliases[str(account_num)]
-            else:
-                worksheet_name = str(account_num)
-            mass_df.loc[account_num].to_excel(writer, worksheet_name)
-            logging.info(f"Wrote results for account {account_num} to output.xlsx in sheet {worksheet_name}")
+    # XML serialization and zip compression dominate the write phase and are
+    # CPU-bound, so shard the accounts across processes, one workbook per worker
+    shard_names = [f"{OUTPUT_STEM}_{rank}.xlsx" for rank in range(workers)]
+    shards = [sheets[rank::workers] for rank in range(workers)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_configure_logging) as executor:
+        list(executor.map(_write_shard, shard_names, shards))
 
 
 def main():
@@ -127,7 +275,9 @@ def main():
     else:
         aliases = {}
     logging.debug(f"Account aliases: {aliases}")
-    spreadsheets = cwd.glob("*.xls")
+    # skip this script's own workbooks, which would otherwise be globbed as
+    # bills on the next run in the same directory
+    spreadsheets = [f for f in cwd.glob("*.xlsx") if not f.name.startswith(OUTPUT_STEM)]
     logging.debug(f"Files to process: {spreadsheets}")
     mass_df = process(spreadsheets, config)
     write_output(mass_df, aliases)